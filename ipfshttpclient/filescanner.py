@@ -4,8 +4,10 @@ import enum
 import fnmatch
 import os
 import re
+import stat
 import sys
 import typing as ty
+import weakref
 
 from . import utils
 
@@ -36,10 +38,12 @@ else:  #PY35
 
 
 O_DIRECTORY = getattr(os, "O_DIRECTORY", 0)  # type: int
+O_NOFOLLOW  = getattr(os, "O_NOFOLLOW",  0)  # type: int
 
 
 HAVE_FWALK       = hasattr(os, "fwalk")  # type: bool
 HAVE_FWALK_BYTES = HAVE_FWALK and sys.version_info >= (3, 7)  # type: bool
+HAVE_SCANDIR_FD  = os.scandir in getattr(os, "supports_fd", set())  # type: bool
 
 
 class Matcher(ty.Generic[ty.AnyStr], metaclass=abc.ABCMeta):
@@ -51,6 +55,9 @@ class Matcher(ty.Generic[ty.AnyStr], metaclass=abc.ABCMeta):
 	def should_descend(self, path: ty.AnyStr) -> bool:
 		r"""Decides whether the file scanner should descend into the given directory path
 		
+		The file scanner asks this at most once for each directory it comes
+		across during a scan, so there is no point in caching the result.
+		
 		Arguments
 		---------
 		path
@@ -86,6 +93,41 @@ class Matcher(ty.Generic[ty.AnyStr], metaclass=abc.ABCMeta):
 			Whether the given path refers to a directory, see the above paragraph
 			for what this means exactly
 		"""
+	
+	def should_descend_labels(self, labels: ty.List[ty.AnyStr], *,
+	                          path: ty.Optional[ty.AnyStr] = None) -> bool:
+		r"""Like :meth:`should_descend`, but receives the path already split
+		into its labels
+		
+		File scanners call this instead of :meth:`should_descend` as they
+		already know the labels of each path they come across. The default
+		implementation calls :meth:`should_descend` with the joined labels,
+		matchers that operate on path labels anyways should override it to
+		skip this.
+		
+		Arguments
+		---------
+		labels
+			The non-empty list of labels of the directory path, upholding the
+			same guarantees as those mentioned in :meth:`should_report`
+		path
+			The same path with its labels already joined, if the caller
+			happens to have it at hand
+		"""
+		if path is None:
+			path = utils.maybe_fsencode(os.path.sep, labels[0]).join(labels)
+		return self.should_descend(path)
+	
+	def should_report_labels(self, labels: ty.List[ty.AnyStr], *, is_dir: bool,
+	                         path: ty.Optional[ty.AnyStr] = None) -> bool:
+		r"""Like :meth:`should_report`, but receives the path already split
+		into its labels
+		
+		See :meth:`should_descend_labels` for details.
+		"""
+		if path is None:
+			path = utils.maybe_fsencode(os.path.sep, labels[0]).join(labels)
+		return self.should_report(path, is_dir=is_dir)
 
 
 class DummyMatcher(Matcher[ty.AnyStr]):
@@ -102,6 +144,39 @@ class DummyMatcher(Matcher[ty.AnyStr]):
 DUMMY_MATCHER = DummyMatcher()  # type: DummyMatcher
 
 
+# Compiled glob patterns are shared between all `GlobMatcher` instances, so
+# that long-running callers passing the same patterns over and over again
+# (repeated `client.add(…)` calls for instance) do not have to recompile
+# them every time
+#
+# Both caches are bounded and will evict their oldest entry first when full.
+_GLOB_CACHE_SIZE = 256  # type: int
+_glob_compiled_t = ty.Tuple[
+	bool,                                  # Directory-only?
+	ty.Tuple[ty.Optional[re_pattern_t], ...],  # Per-label expressions
+	ty.Optional[re_pattern_t],             # Whole-path expression for files
+	ty.Optional[re_pattern_t]              # Whole-path expression for directories
+]
+if ty.TYPE_CHECKING:
+	_cache_t = collections.OrderedDict[ty.Any, ty.Any]
+	_glob_cache_t = collections.OrderedDict[
+		ty.Tuple[ty.Any, ...],  # (Binary?, Pattern, Period special?, Separator, Alt. separator)
+		_glob_compiled_t
+	]
+	_label_re_cache_t = collections.OrderedDict[
+		ty.Tuple[bool, ty.Union[str, bytes], bool],  # (Binary?, Label, Period special?)
+		re_pattern_t
+	]
+_GLOB_CACHE = collections.OrderedDict()  # type: _glob_cache_t
+_LABEL_RE_CACHE = collections.OrderedDict()  # type: _label_re_cache_t
+
+
+def _cache_store(cache: '_cache_t', key: ty.Any, value: ty.Any) -> None:
+	cache[key] = value
+	if len(cache) > _GLOB_CACHE_SIZE:
+		cache.popitem(last=False)
+
+
 class GlobMatcher(Matcher[ty.AnyStr], ty.Generic[ty.AnyStr]):
 	"""Matches files and directories according to the shell glob conventions
 	
@@ -122,11 +197,14 @@ class GlobMatcher(Matcher[ty.AnyStr], ty.Generic[ty.AnyStr]):
 	such cases, but if you're wondering why your pattern just won't match while
 	pasting it into a real shell works this may be why.
 	"""
-	__slots__ = ("period_special", "_sep", "_pat", "_dir_only")
+	__slots__ = ("period_special", "_sep", "_dot", "_pat", "_dir_only", "_full_re", "_full_re_dir")
 	#period_special: bool
 	#_sep: ty.AnyStr
-	#_pat: ty.List[ty.Optional[re_pattern_t]]
+	#_dot: ty.AnyStr
+	#_pat: ty.Tuple[ty.Optional[re_pattern_t], ...]
 	#_dir_only: bool
+	#_full_re: ty.Optional[re_pattern_t]
+	#_full_re_dir: ty.Optional[re_pattern_t]
 	
 	def __init__(self, pat: ty.AnyStr, *, period_special: bool = True):
 		"""
@@ -142,13 +220,28 @@ class GlobMatcher(Matcher[ty.AnyStr], ty.Generic[ty.AnyStr]):
 		self.period_special = period_special  # type: bool
 		
 		self._sep = utils.maybe_fsencode(os.path.sep, pat)  # type: ty.AnyStr
+		self._dot = utils.maybe_fsencode(".", pat)  # type: ty.AnyStr
+		self._dir_only, self._pat, self._full_re, self._full_re_dir \
+		    = self._compile(pat, period_special)
+	
+	
+	@classmethod
+	def _compile(cls, pat: ty.AnyStr, period_special: bool) -> _glob_compiled_t:
+		# The result also depends on the current path separators as these are
+		# replaced/split on below
+		cache_key = (isinstance(pat, bytes), pat, period_special, os.path.sep, os.path.altsep)
+		try:
+			return _GLOB_CACHE[cache_key]
+		except KeyError:
+			pass
+		
+		sep = utils.maybe_fsencode(os.path.sep, pat)  # type: ty.AnyStr
 		dblstar = utils.maybe_fsencode("**", pat)  # type: ty.AnyStr
 		dot = utils.maybe_fsencode(".", pat)  # type: ty.AnyStr
-		pat_ndot = utils.maybe_fsencode(r"(?![.])", pat)  # type: ty.AnyStr
 		
 		# Normalize path separator
 		if os.path.altsep:
-			pat = pat.replace(utils.maybe_fsencode(os.path.altsep, pat), self._sep)
+			pat = pat.replace(utils.maybe_fsencode(os.path.altsep, pat), sep)
 		
 		# Sanity checks for stuff that will definitely NOT EVER match
 		# (there is another one in the loop below)
@@ -159,10 +252,11 @@ class GlobMatcher(Matcher[ty.AnyStr], ty.Generic[ty.AnyStr]):
 		# (TBH, I find it hard to see how that is useful, but everybody does it
 		#  and it keeps things consistent overall – something to only match files
 		#  would be nice however.)
-		self._dir_only = pat.endswith(self._sep)  # type: bool
+		dir_only = pat.endswith(sep)  # type: bool
 		
-		self._pat = []  # type: ty.List[ty.Optional[re_pattern_t]]
-		for label in pat.split(self._sep):
+		labels     = []  # type: ty.List[ty.Optional[re_pattern_t]]
+		labels_raw = []  # type: ty.List[ty.Optional[ty.AnyStr]]
+		for label in pat.split(sep):
 			# Skip over useless path components
 			if len(label) < 1 or label == dot:
 				continue
@@ -170,7 +264,11 @@ class GlobMatcher(Matcher[ty.AnyStr], ty.Generic[ty.AnyStr]):
 			assert label != dot + dot, 'Matching patterns containing ".." will never match'
 			
 			if label == dblstar:
-				self._pat.append(None)
+				# Runs of recursive labels are equivalent to a single one, but would
+				# each cause another level of recursion while matching
+				if not labels or labels[-1] is not None:
+					labels.append(None)
+					labels_raw.append(None)
 			elif dblstar in label:
 				raise NotImplementedError(
 					"Using double-star (**) and other characters in the same glob "
@@ -178,19 +276,191 @@ class GlobMatcher(Matcher[ty.AnyStr], ty.Generic[ty.AnyStr]):
 					"an issue if you need this!".format(os.fsdecode(label))
 				)
 			else:
-				#re_expr: ty.AnyStr
-				if not isinstance(label, bytes):
-					re_expr = fnmatch.translate(label)
+				labels.append(cls._compile_label(label, period_special))
+				labels_raw.append(label)
+		
+		# Patterns without any recursive labels, except for possibly the first
+		# and last one, are very common and can be matched against the whole path
+		# at once, saving the label-by-label recursion of `_match` for each path
+		full_re, full_re_dir = cls._compile_full(labels_raw, sep, period_special)
+		
+		result = (dir_only, tuple(labels), full_re, full_re_dir)  # type: _glob_compiled_t
+		_cache_store(_GLOB_CACHE, cache_key, result)
+		return result
+	
+	
+	@staticmethod
+	def _compile_label(label: ty.AnyStr, period_special: bool) -> re_pattern_t:
+		cache_key = (isinstance(label, bytes), label, period_special)
+		try:
+			return _LABEL_RE_CACHE[cache_key]
+		except KeyError:
+			pass
+		
+		#re_expr: ty.AnyStr
+		if not isinstance(label, bytes):
+			re_expr = fnmatch.translate(label)
+		else:
+			re_expr = fnmatch.translate(label.decode("latin-1")).encode("latin-1")
+		
+		if period_special and not label.startswith(utils.maybe_fsencode(".", label)):
+			re_expr = utils.maybe_fsencode(r"(?![.])", label) + re_expr
+		
+		label_re = re.compile(re_expr)  # type: re_pattern_t
+		_cache_store(_LABEL_RE_CACHE, cache_key, label_re)
+		return label_re
+	
+	
+	@classmethod
+	def _compile_full(cls, labels: ty.List[ty.Optional[ty.AnyStr]], sep: ty.AnyStr,
+	                  period_special: bool) \
+	    -> ty.Tuple[ty.Optional[re_pattern_t], ty.Optional[re_pattern_t]]:
+		"""Compiles the given pattern labels (``None`` representing ``**``) into
+		expressions matching entire file and directory paths respectively
+		
+		Returns ``(None, None)`` if the labels cannot be expressed this way, in
+		which case the regular label-by-label matching must be used.
+		"""
+		if len(labels) < 1:
+			return None, None
+		
+		leading  = labels[0] is None  # type: bool
+		trailing = labels[-1] is None and (len(labels) > 1 or not leading)  # type: bool
+		inner    = labels[(1 if leading else 0):(-1 if trailing else None)]  # type: ty.List[ty.Any]
+		if None in inner:
+			return None, None
+		
+		is_bytes = isinstance(sep, bytes)  # type: bool
+		labels_str = [
+			label.decode("latin-1") if is_bytes else label for label in inner
+		]  # type: ty.List[str]
+		sep_str    = sep.decode("latin-1") if is_bytes else sep  # type: str
+		
+		# `fnmatch` uses constructs that cannot be embedded into a larger
+		# expression to prevent catastrophic backtracking on labels with several
+		# wildcards and those labels may also contain backslash escapes that
+		# would be interpreted differently here – leave these labels to `_match`
+		if any(label.count("*") > 1 or "\\" in label for label in labels_str):
+			return None, None
+		
+		sep_re  = re.escape(sep_str)  # type: str
+		ndot_re = "(?![.])" if period_special else ""  # type: str
+		label_exprs = [
+			cls._translate_label(label, sep_re, period_special) for label in labels_str
+		]
+		
+		# A leading `**` consumes any number of leading labels, a trailing one
+		# requires at least one more label – in both cases the first label
+		# consumed may not be hidden when periods are special
+		expr_prefix = ""  # type: str
+		expr_suffix = ""  # type: str
+		if leading:
+			expr_prefix = "(?:{0}[^{1}]+{1})*".format(ndot_re, sep_re)
+		if trailing:
+			expr_suffix = "{1}{0}[^{1}]+(?:{1}.*)?".format(ndot_re, sep_re)
+		
+		if len(label_exprs) < 1:
+			# Just `**`, which only cares about the first label not being hidden
+			expr_prefix = ""
+			expr_file = expr_dir = "{0}[^{1}]+(?:{1}.*)?".format(ndot_re, sep_re)  # type: str
+		else:
+			# Files must match the full pattern, while directories are also
+			# included if they only match its leading labels as the actual match
+			# may still be found inside of them
+			expr_file = sep_re.join(label_exprs) + expr_suffix
+			expr_dir  = label_exprs[-1] + expr_suffix
+			for label_expr in reversed(label_exprs[:-1]):
+				expr_dir = "{0}(?:{1}{2})?".format(label_expr, sep_re, expr_dir)
+		
+		try:
+			if is_bytes:
+				return (re.compile((expr_prefix + expr_file).encode("latin-1"), re.DOTALL),
+				        re.compile((expr_prefix + expr_dir).encode("latin-1"),  re.DOTALL))
+			else:
+				return (re.compile(expr_prefix + expr_file, re.DOTALL),
+				        re.compile(expr_prefix + expr_dir,  re.DOTALL))
+		except re.error:
+			return None, None
+	
+	
+	@staticmethod
+	def _translate_label(label: str, sep_re: str, period_special: bool) -> str:
+		"""Like :func:`fnmatch.translate`, but never matches the path separator
+		and without any anchoring, so that the result may be embedded into an
+		expression matching several path labels at once"""
+		expr = "(?![.])" if period_special and not label.startswith(".") else ""  # type: str
+		idx, length = 0, len(label)
+		while idx < length:
+			char = label[idx]
+			idx += 1
+			if char == "*":
+				expr += "[^{0}]*".format(sep_re)
+			elif char == "?":
+				expr += "[^{0}]".format(sep_re)
+			elif char == "[":
+				end = idx
+				if end < length and label[end] == "!":
+					end += 1
+				if end < length and label[end] == "]":
+					end += 1
+				while end < length and label[end] != "]":
+					end += 1
+				
+				if end >= length:
+					expr += "\\["
+					continue
+				
+				# Split the set on hyphens to tell ranges apart from literal
+				# hyphens and drop any empty ranges (both like `fnmatch` does)
+				chunks = []  # type: ty.List[str]
+				start = idx
+				hyphen = idx + (2 if label[idx] == "!" else 1)  # type: int
+				while True:
+					hyphen = label.find("-", hyphen, end)
+					if hyphen < 0:
+						break
+					chunks.append(label[start:hyphen])
+					start = hyphen + 1
+					hyphen += 3
+				if start < end:
+					chunks.append(label[start:end])
 				else:
-					re_expr = fnmatch.translate(label.decode("latin-1")).encode("latin-1")
+					chunks[-1] += "-"
+				for chunk_idx in range(len(chunks) - 1, 0, -1):
+					if chunks[chunk_idx - 1][-1] > chunks[chunk_idx][0]:
+						chunks[chunk_idx - 1] = chunks[chunk_idx - 1][:-1] + chunks[chunk_idx][1:]
+						del chunks[chunk_idx]
+				idx = end + 1
+				
+				# Escape backslashes and hyphens not delimiting a range, as well
+				# as all characters that may become set operations in the future
+				chars = "-".join(
+					c.replace("\\", "\\\\").replace("-", "\\-") for c in chunks
+				)  # type: str
+				chars = re.sub(r"([&~|])", r"\\\1", chars)
 				
-				if period_special and not label.startswith(dot):
-					re_expr = pat_ndot + re_expr
-				self._pat.append(re.compile(re_expr))
+				if not chars:
+					expr += "(?!)"  # Empty range: never matches
+				elif chars == "!":
+					expr += "[^{0}]".format(sep_re)
+				else:
+					if chars[0] == "!":
+						chars = "^" + chars[1:]
+					elif chars[0] in ("^", "["):
+						chars = "\\" + chars
+					expr += "(?!{0})[{1}]".format(sep_re, chars)
+			else:
+				expr += re.escape(char)
+		return expr
 	
 	
 	def should_descend(self, path: ty.AnyStr) -> bool:
-		for idx, label in enumerate(path.split(self._sep)):
+		return self.should_descend_labels(path.split(self._sep))
+	
+	
+	def should_descend_labels(self, labels: ty.List[ty.AnyStr], *,
+	                          path: ty.Optional[ty.AnyStr] = None) -> bool:
+		for idx, label in enumerate(labels):
 			# Always descend into any directory below a recursive pattern as we
 			# cannot predict what we will later do a tail match on
 			if self._pat[idx] is None:
@@ -218,10 +488,29 @@ class GlobMatcher(Matcher[ty.AnyStr], ty.Generic[ty.AnyStr]):
 		if self._dir_only and not is_dir:
 			return False
 		
+		if self._full_re is not None:
+			full_re = self._full_re_dir if is_dir else self._full_re  # type: re_pattern_t
+			return full_re.fullmatch(path) is not None
+		
 		labels = path.split(self._sep)  # type: ty.List[ty.AnyStr]
 		return self._match(labels, idx_pat=0, idx_path=0, is_dir=is_dir)
 	
 	
+	def should_report_labels(self, labels: ty.List[ty.AnyStr], *, is_dir: bool,
+	                         path: ty.Optional[ty.AnyStr] = None) -> bool:
+		# A final slash means “only match directories”
+		if self._dir_only and not is_dir:
+			return False
+		
+		if self._full_re is not None:
+			if path is None:
+				path = self._sep.join(labels)
+			full_re = self._full_re_dir if is_dir else self._full_re  # type: re_pattern_t
+			return full_re.fullmatch(path) is not None
+		
+		return self._match(labels, idx_pat=0, idx_path=0, is_dir=is_dir)
+	
+	
 	def _match(self, labels: ty.List[ty.AnyStr], *, idx_pat: int, idx_path: int,
 	           is_dir: bool) -> bool:
 		while idx_pat < len(self._pat) and self._pat[idx_pat] is not None:
@@ -237,14 +526,12 @@ class GlobMatcher(Matcher[ty.AnyStr], ty.Generic[ty.AnyStr]):
 			idx_pat += 1
 			idx_path += 1
 		
-		dot = utils.maybe_fsencode(".", labels[0])  # type: ty.AnyStr
-		
 		# We reached the end of the matching labels or the start of recursion
 		if idx_pat == len(self._pat):
 			# End of matching labels – only include path if it was of the same
 			# length or the previous pattern label was recursive
 			if self._pat[idx_pat - 1] is None:
-				return not self.period_special or not labels[idx_path].startswith(dot)
+				return not self.period_special or not labels[idx_path].startswith(self._dot)
 			else:
 				return idx_path == len(labels)
 		
@@ -259,7 +546,7 @@ class GlobMatcher(Matcher[ty.AnyStr], ty.Generic[ty.AnyStr]):
 				return True
 			
 			# Do not add dot-files as part of recursive patterns by default
-			if self.period_special and labels[idx_path].startswith(dot):
+			if self.period_special and labels[idx_path].startswith(self._dot):
 				break
 			
 			idx_path += 1
@@ -287,33 +574,65 @@ class ReMatcher(Matcher[ty.AnyStr], ty.Generic[ty.AnyStr]):
 	problems for you *use non-recursive glob patterns instead* or implement your
 	own matcher with a proper :meth:`Matcher.should_descend` method.
 	"""
-	__slots__ = ("_pat",)
+	__slots__ = ("_pat", "_sep")
 	#_pat: re_pattern_t
+	#_sep: ty.AnyStr
 	
 	def __init__(self, pat: re_pattern_t):
 		self._pat = re.compile(pat)  # type: re_pattern_t
+		self._sep = utils.maybe_fsencode(os.path.sep, self._pat.pattern)  # type: ty.AnyStr
 	
 	def should_descend(self, path: ty.AnyStr) -> bool:
 		return True
 	
 	def should_report(self, path: ty.AnyStr, *, is_dir: bool) -> bool:
-		suffix = utils.maybe_fsencode(os.path.sep, path) if is_dir else type(path)()  # type: ty.AnyStr
-		return bool(self._pat.match(path + suffix))
+		# Directory paths have to be extended by the trailing separator that the
+		# pattern uses to tell them apart (there is no way to rewrite an arbitrary
+		# pattern to accept the path without it instead), but file paths may be
+		# matched as-is
+		if is_dir:
+			return self._pat.match(path + self._sep) is not None
+		return self._pat.match(path) is not None
 
 
 class MetaMatcher(Matcher[ty.AnyStr], ty.Generic[ty.AnyStr]):
-	"""Match files and directories by delegating to other matchers"""
+	"""Match files and directories by delegating to other matchers
+	
+	Children are asked in the given order and the first one to accept a path
+	decides the outcome, so placing the matchers most likely to accept a path
+	first will save the remaining ones from being consulted at all.
+	"""
 	__slots__ = ("_children",)
-	#_children: ty.List[Matcher[ty.AnyStr]]
+	#_children: ty.Tuple[Matcher[ty.AnyStr], ...]
 	
-	def __init__(self, children: ty.List[Matcher[ty.AnyStr]]):
-		self._children = children  # type: ty.List[Matcher[ty.AnyStr]]
+	def __init__(self, children: ty.Iterable[Matcher[ty.AnyStr]]):
+		self._children = tuple(children)  # type: ty.Tuple[Matcher[ty.AnyStr], ...]
 	
 	def should_descend(self, path: ty.AnyStr) -> bool:
-		return any(m.should_descend(path) for m in self._children)
+		for child in self._children:
+			if child.should_descend(path):
+				return True
+		return False
 	
 	def should_report(self, path: ty.AnyStr, *, is_dir: bool) -> bool:
-		return any(m.should_report(path, is_dir=is_dir) for m in self._children)
+		for child in self._children:
+			if child.should_report(path, is_dir=is_dir):
+				return True
+		return False
+	
+	def should_descend_labels(self, labels: ty.List[ty.AnyStr], *,
+	                          path: ty.Optional[ty.AnyStr] = None) -> bool:
+		for child in self._children:
+			if child.should_descend_labels(labels, path=path):
+				return True
+		return False
+	
+	def should_report_labels(self, labels: ty.List[ty.AnyStr], *, is_dir: bool,
+	                         path: ty.Optional[ty.AnyStr] = None) -> bool:
+		for child in self._children:
+			if child.should_report_labels(labels, is_dir=is_dir, path=path):
+				return True
+		return False
 
 
 class NoRecusionAdapterMatcher(Matcher[ty.AnyStr], ty.Generic[ty.AnyStr]):
@@ -335,7 +654,18 @@ class NoRecusionAdapterMatcher(Matcher[ty.AnyStr], ty.Generic[ty.AnyStr]):
 		return False
 	
 	def should_report(self, path: ty.AnyStr, *, is_dir: bool) -> bool:
-		return os.path.sep not in path and self._child.should_report(path, is_dir=is_dir)
+		return utils.maybe_fsencode(os.path.sep, path) not in path \
+		       and self._child.should_report(path, is_dir=is_dir)
+	
+	def should_descend_labels(self, labels: ty.List[ty.AnyStr], *,
+	                          path: ty.Optional[ty.AnyStr] = None) -> bool:
+		return False
+	
+	def should_report_labels(self, labels: ty.List[ty.AnyStr], *, is_dir: bool,
+	                         path: ty.Optional[ty.AnyStr] = None) -> bool:
+		# Only top-level paths consist of a single label
+		return len(labels) == 1 \
+		       and self._child.should_report_labels(labels, is_dir=is_dir, path=path)
 
 
 _match_spec_t = ty.Union[ty.AnyStr, re_pattern_t, Matcher[ty.AnyStr]]
@@ -390,9 +720,9 @@ FSNodeEntry = ty.NamedTuple("FSNodeEntry", [
 
 
 class walk(ty.Iterator[FSNodeEntry], ty.Generic[ty.AnyStr]):
-	__slots__ = ("_generator", "_close_fd")
+	__slots__ = ("_generator", "_fd_finalizer", "__weakref__")
 	#_generator: ty.Generator[FSNodeEntry, ty.Any, None]
-	#_close_fd: ty.Optional[int]
+	#_fd_finalizer: ty.Optional[weakref.finalize]
 	
 	def __init__(
 			self,
@@ -436,7 +766,7 @@ class walk(ty.Iterator[FSNodeEntry], ty.Generic[ty.AnyStr]):
 			:class:`NoRecusionAdapterMatcher` and hence prevent the scanner from
 			doing any recursion.
 		"""
-		self._close_fd = None  # type: ty.Optional[int]
+		self._fd_finalizer = None  # type: ty.Optional[weakref.finalize]
 		
 		# Convert directory path to string …
 		directory_str = None  # type: ty.Optional[ty.AnyStr]
@@ -450,7 +780,11 @@ class walk(ty.Iterator[FSNodeEntry], ty.Generic[ty.AnyStr]):
 			#
 			# Note: `os.fwalk` support for binary paths was only added in 3.7+.
 			if HAVE_FWALK and (not isinstance(directory, bytes) or HAVE_FWALK_BYTES):
-				self._close_fd = directory = os.open(directory, os.O_RDONLY | O_DIRECTORY)
+				directory = os.open(directory, os.O_RDONLY | O_DIRECTORY)
+				
+				# Closed by `close()`, or when this object is garbage collected
+				# without that ever having been called
+				self._fd_finalizer = weakref.finalize(self, os.close, directory)
 		elif not HAVE_FWALK:
 			raise NotImplementedError("Passing a file descriptor as directory is "
 			                          "not supported on this platform")
@@ -484,18 +818,107 @@ class walk(ty.Iterator[FSNodeEntry], ty.Generic[ty.AnyStr]):
 		try:
 			self._generator.close()
 		finally:
-			if self._close_fd is not None:
-				os.close(self._close_fd)
-				self._close_fd = None
+			if self._fd_finalizer is not None:
+				self._fd_finalizer()
 	
 	@staticmethod
-	def _join_dirs_and_files(dirnames: ty.List[ty.AnyStr], filenames: ty.List[ty.AnyStr]) \
-	    -> ty.Iterator[ty.Tuple[ty.AnyStr, bool]]:
-		for dirname in dirnames:
-			yield (dirname, True)
+	def _list_dir(directory: ty.Union[ty.AnyStr, int], want_bytes: bool, follow_symlinks: bool) \
+	    -> ty.Tuple[ty.List[ty.AnyStr], ty.List[ty.AnyStr], ty.Set[ty.AnyStr]]:
+		dirnames  = []  # type: ty.List[ty.AnyStr]
+		filenames = []  # type: ty.List[ty.AnyStr]
+		linknames = set()  # type: ty.Set[ty.AnyStr]
 		
-		for filename in filenames:
-			yield (filename, False)
+		if isinstance(directory, int) and not HAVE_SCANDIR_FD:  #PY36-
+			for name in os.listdir(directory):
+				try:
+					is_dir = stat.S_ISDIR(os.stat(name, dir_fd=directory).st_mode)  # type: bool
+					is_link = is_dir and not follow_symlinks and stat.S_ISLNK(os.stat(
+						name, dir_fd=directory, follow_symlinks=False
+					).st_mode)  # type: bool
+				except OSError:
+					is_dir = is_link = False
+				
+				name = os.fsencode(name) if want_bytes else name
+				(dirnames if is_dir else filenames).append(name)
+				if is_link:
+					linknames.add(name)
+		else:
+			# Directory entries will usually know whether they refer to a directory
+			# (or symbolic link) or not without any extra `stat` call
+			scandir_iter = os.scandir(directory)
+			try:
+				for entry in scandir_iter:
+					try:
+						is_dir = entry.is_dir()
+						is_link = is_dir and not follow_symlinks and entry.is_symlink()
+					except OSError:
+						is_dir = is_link = False
+					
+					# Names of entries scanned through a file descriptor are always `str`
+					name = entry.name
+					if want_bytes and not isinstance(name, bytes):
+						name = os.fsencode(name)
+					(dirnames if is_dir else filenames).append(name)
+					if is_link:
+						linknames.add(name)
+			finally:
+				if hasattr(scandir_iter, "close"):  #PY36+
+					scandir_iter.close()
+		
+		return dirnames, filenames, linknames
+	
+	@classmethod
+	def _scan(
+			cls,
+			dirpath: ty.AnyStr,
+			dirfd: ty.Optional[int],
+			sep: ty.AnyStr,
+			follow_symlinks: bool
+	) -> ty.Generator[
+		ty.Tuple[ty.AnyStr, ty.List[ty.AnyStr], ty.List[ty.AnyStr], ty.Optional[int]],
+		ty.Any, None
+	]:
+		"""Top-down directory tree walk yielding the same tuples as :func:`os.fwalk`
+		
+		Unlike :func:`os.walk` and :func:`os.fwalk` this does not make any extra
+		``stat`` calls for deciding whether to recurse into a directory. Like
+		with these, symbolic links to directories are reported as directories,
+		but only recursed into if *follow_symlinks* is set, removing entries from
+		the yielded directory name list will prevent recursion into them and
+		errors while listing a directory will cause it to be skipped silently.
+		
+		If *dirfd* is given, it must refer to the same directory as *dirpath* and
+		all directories will be accessed relative to it instead of by path. The
+		file descriptors yielded are only valid until the next value is requested.
+		"""
+		try:
+			dirnames, filenames, linknames = cls._list_dir(
+				dirfd if dirfd is not None else dirpath, isinstance(sep, bytes), follow_symlinks
+			)
+		except OSError:
+			return
+		
+		yield dirpath, dirnames, filenames, dirfd
+		
+		for dirname in dirnames:
+			if dirname in linknames:
+				continue
+			
+			if dirfd is None:
+				yield from cls._scan(dirpath + sep + dirname, None, sep, follow_symlinks)
+				continue
+			
+			flags = os.O_RDONLY | O_DIRECTORY  # type: int
+			if not follow_symlinks:
+				flags |= O_NOFOLLOW
+			try:
+				subdirfd = os.open(dirname, flags, dir_fd=dirfd)  # type: int
+			except OSError:
+				continue
+			try:
+				yield from cls._scan(dirpath + sep + dirname, subdirfd, sep, follow_symlinks)
+			finally:
+				os.close(subdirfd)
 	
 	def _walk(
 			self,
@@ -509,12 +932,18 @@ class walk(ty.Iterator[FSNodeEntry], ty.Generic[ty.AnyStr]):
 		       if directory_str is not None else os.path.sep)
 		dot = utils.maybe_fsencode(".", sep)  # type: ty.AnyStr
 		
-		# Identify the leading portion of the `dirpath` returned by `os.walk`
+		# Identify the leading portion of the `dirpath` returned by `_scan`
 		# that should be dropped
 		if not isinstance(directory, int):
-			while directory.endswith(sep):
-				directory = directory[:-len(sep)]
+			directory = directory.rstrip(sep)
 		prefix = (directory if not isinstance(directory, int) else dot) + sep
+		prefix_len = len(prefix)  # type: int
+		
+		# Scanning everything is the most common case by far and allows skipping
+		# all of the matching below: Every directory is reported before its
+		# contents then, so intermediate directories need no tracking either
+		match_all = isinstance(matcher, DummyMatcher)  # type: bool
+		intermediate_dirs = intermediate_dirs and not match_all
 		
 		reported_directories = set()  # type: ty.Set[ty.AnyStr]
 		
@@ -529,75 +958,105 @@ class walk(ty.Iterator[FSNodeEntry], ty.Generic[ty.AnyStr]):
 		)
 		
 		if not isinstance(directory, int):
-			walk_iter = os.walk(directory, followlinks=follow_symlinks)
+			walk_iter = self._scan(directory, None, sep, follow_symlinks)
 		else:
-			walk_iter = os.fwalk(dot, dir_fd=directory, follow_symlinks=follow_symlinks)
+			walk_iter = self._scan(dot, directory, sep, follow_symlinks)
 		try:
-			for result in walk_iter:
-				dirpath, dirnames, filenames = result[0:3]
-				dirfd = result[3] if len(result) > 3 else None
-				
+			for dirpath, dirnames, filenames, dirfd in walk_iter:
 				# Remove the directory prefix from the received path
-				_, _, dirpath = dirpath.partition(prefix)
+				#
+				# All received paths start with the prefix, except for the top-level
+				# directory itself which lacks its final separator and hence ends up
+				# being empty as it should.
+				dirpath = dirpath[prefix_len:]
+				
+				# Split the directory path only once for all of its children
+				dir_labels = []  # type: ty.List[ty.AnyStr]
+				if dirpath and not match_all:
+					dir_labels = dirpath.split(sep)
+				
+				# Paths of the children are then just the name appended to these
+				# (`dirpath` never has a trailing separator and names never contain one)
+				relpath_prefix = (dirpath + sep) if dirpath else dirpath  # type: ty.AnyStr
+				path_prefix    = prefix + relpath_prefix  # type: ty.AnyStr
 				
 				# Keep track of reported intermediaries, so that we only check for
 				# these at most once per directory base
 				intermediates_reported = False  # type: bool
 				
-				for filename, is_dir in self._join_dirs_and_files(list(dirnames), filenames):
-					filepath = os.path.join(dirpath, filename)
-					
-					# Check if matcher thinks we should descend into this directory
-					if is_dir and not matcher.should_descend(filepath):
-						dirnames.remove(filename)
-					
-					# Check if matcher thinks we should report this node
-					if not matcher.should_report(filepath, is_dir=is_dir):
-						continue
-					
-					# Ensure that all containing directories are reported
-					# before reporting this node
-					if not intermediates_reported and intermediate_dirs:
-						parts = dirpath.split(sep)
-						for end_offset in range(len(parts)):
-							parent_dirpath = sep.join(parts[0:(end_offset + 1)])
-							if parent_dirpath not in reported_directories:
-								reported_directories.add(parent_dirpath)
-								yield FSNodeEntry(
-									type     = FSNodeType.DIRECTORY,
-									path     = (prefix + parent_dirpath),
-									relpath  = parent_dirpath,
-									name     = parts[end_offset],
-									parentfd = None
-								)
+				# Indices of the directories that should not be descended into
+				skipped_dirnames = []  # type: ty.List[int]
+				
+				for names, is_dir in ((dirnames, True), (filenames, False)):
+					for idx, filename in enumerate(names):
+						filepath = relpath_prefix + filename  # type: ty.AnyStr
+						
+						if not match_all:
+							filepath_labels = dir_labels + [filename]  # type: ty.List[ty.AnyStr]
+							
+							# Check if matcher thinks we should descend into this directory
+							if is_dir and not matcher.should_descend_labels(
+								filepath_labels, path=filepath
+							):
+								skipped_dirnames.append(idx)
+							
+							# Check if matcher thinks we should report this node
+							if not matcher.should_report_labels(
+								filepath_labels, is_dir=is_dir, path=filepath
+							):
+								continue
+						
+						# Ensure that all containing directories are reported
+						# before reporting this node
+						#
+						# Directories are only ever reported after all of their parents,
+						# so there is nothing to do if the containing directory itself
+						# has been reported already.
+						if not intermediates_reported and intermediate_dirs \
+						   and dirpath not in reported_directories:
+							parent_dirpath = None  # type: ty.Optional[ty.AnyStr]
+							for label in dir_labels:
+								parent_dirpath = label if parent_dirpath is None \
+								                 else parent_dirpath + sep + label
+								if parent_dirpath not in reported_directories:
+									reported_directories.add(parent_dirpath)
+									yield FSNodeEntry(
+										type     = FSNodeType.DIRECTORY,
+										path     = (prefix + parent_dirpath),
+										relpath  = parent_dirpath,
+										name     = label,
+										parentfd = None
+									)
 						intermediates_reported = True
-					
-					# Report the target file or directory
-					if is_dir:
-						reported_directories.add(filepath)
-						yield FSNodeEntry(
-							type     = FSNodeType.DIRECTORY,
-							path     = (prefix + filepath),
-							relpath  = filepath,
-							name     = filename,
-							parentfd = dirfd
-						)
-					else:
-						yield FSNodeEntry(
-							type     = FSNodeType.FILE,
-							path     = (prefix + filepath),
-							relpath  = filepath,
-							name     = filename,
-							parentfd = dirfd
-						)
+						
+						# Report the target file or directory
+						if is_dir:
+							if intermediate_dirs:
+								reported_directories.add(filepath)
+							yield FSNodeEntry(
+								type     = FSNodeType.DIRECTORY,
+								path     = (path_prefix + filename),
+								relpath  = filepath,
+								name     = filename,
+								parentfd = dirfd
+							)
+						else:
+							yield FSNodeEntry(
+								type     = FSNodeType.FILE,
+								path     = (path_prefix + filename),
+								relpath  = filepath,
+								name     = filename,
+								parentfd = dirfd
+							)
+				
+				# Prevent the scanner from descending into skipped directories
+				for idx in reversed(skipped_dirnames):
+					del dirnames[idx]
 		finally:
-			# Make sure the file descriptors bound by `os.fwalk` are freed on error
+			# Make sure the file descriptors bound by the walk are freed on error
+			#
+			# (The root file descriptor is owned and closed by `close()`.)
 			walk_iter.close()
-			
-			# Close root file descriptor of `os.fwalk` as well
-			if self._close_fd is not None:
-				os.close(self._close_fd)
-				self._close_fd = None
 
 
 if HAVE_FWALK:  # pragma: no cover
@@ -1,7 +1,10 @@
+import collections
+import gc
 import os.path
 import re
 import sys
 import typing as ty
+import warnings
 
 import pytest
 
@@ -17,8 +20,10 @@ TEST_FILE_DIR = os.path.join(os.path.dirname(__file__), "..", "functional")  # t
 	(b"literal",                 [br"(?![.])(?s:literal)\Z"], {}),
 	("*.a",                      [r"(?![.])(?s:.*\.a)\Z"], {}),
 	(b"*.a",                     [br"(?![.])(?s:.*\.a)\Z"], {}),
-	("*/**/*.dir/**/**/.hidden", [r"(?![.])(?s:.*)\Z", None, r"(?![.])(?s:.*\.dir)\Z", None, None, r"(?s:\.hidden)\Z"], {}),
-	("*/**/*.dir/**/**/.hidden", [r"(?s:.*)\Z", None, r"(?s:.*\.dir)\Z", None, None, r"(?s:\.hidden)\Z"], {"period_special": False}),
+	("*/**/*.dir/**/**/.hidden", [r"(?![.])(?s:.*)\Z", None, r"(?![.])(?s:.*\.dir)\Z", None, r"(?s:\.hidden)\Z"], {}),
+	("*/**/*.dir/**/**/.hidden", [r"(?s:.*)\Z", None, r"(?s:.*\.dir)\Z", None, r"(?s:\.hidden)\Z"], {"period_special": False}),
+	("**/./**/**/*.a",           [None, r"(?![.])(?s:.*\.a)\Z"], {}),
+	("**/**/",                   [None], {}),
 	("././/////////./*.a",       [r"(?![.])(?s:.*\.a)\Z"], {}),
 	(b"././/////////./*.a",      [br"(?![.])(?s:.*\.a)\Z"], {}),
 	("*/*.a",                    [r"(?![.])(?s:.*)\Z", r"(?![.])(?s:.*\.a)\Z"], {}),
@@ -40,6 +45,26 @@ def test_glob_sep_normalize(monkeypatch):
 	assert len(filescanner.GlobMatcher("a#b~c")._pat) == 2
 
 
+def test_glob_compile_cached():
+	matcher1 = filescanner.GlobMatcher("*/*.a")
+	matcher2 = filescanner.GlobMatcher("*/*.a")
+	assert matcher1._pat is matcher2._pat
+	
+	# Identical labels are shared even across different patterns
+	assert filescanner.GlobMatcher("*.a")._pat[0] is matcher1._pat[1]
+	
+	# Mind the difference between binary and text patterns
+	assert isinstance(filescanner.GlobMatcher(b"*.a")._pat[0].pattern, bytes)
+
+
+def test_glob_compile_cache_bounded():
+	for idx in range(filescanner._GLOB_CACHE_SIZE + 10):
+		filescanner.GlobMatcher("file-{0}".format(idx))
+	
+	assert len(filescanner._GLOB_CACHE)     == filescanner._GLOB_CACHE_SIZE
+	assert len(filescanner._LABEL_RE_CACHE) == filescanner._GLOB_CACHE_SIZE
+
+
 # Possible hypothesis test: Parsing glob should never fail, except in the following 3 cases.
 
 @pytest.mark.skipif(sys.flags.optimize, reason="Glob error asserts are stripped from optimized code")
@@ -79,6 +104,8 @@ def test_glob_not_implemented():
 	("literal/more",  "literal",       False, False, False, {"recursive": False}),
 	("literal/more",  "literal",       True,  False, True,  {"recursive": False}),
 	("literal/more",  "literal/more",  False, False, False, {"recursive": False}),
+	(b"literal/more", b"literal",      True,  False, True,  {"recursive": False}),
+	(b"literal/more", b"literal/more", False, False, False, {"recursive": False}),
 	
 	# Test basic leading-period handling
 	("*.a", ".a", False, False, False, {}),
@@ -98,8 +125,35 @@ def test_glob_not_implemented():
 	("*/**/*.dir/**/**/.hidden", "a/b.dir/.hidden",               False, True,  True,  {}),
 	("*/**/*.dir/**/**/.hidden", "a/u/v/w/b.dir/c/d/e/f/.hidden", False, True,  True,  {}),
 	("**", ".a", False, True, False, {}),
+	("**/**/**/*.a", "u/v/w/x/y/z.a",  False, True, True,  {}),
+	("**/**/**/*.a", "u/v/.w/x/y/z.a", False, True, False, {}),
 	(filescanner.GlobMatcher("**"), ".a", False, True, False, {}),
 	
+	# Tests for whole-path matching with leading and trailing double-stars
+	("**/*.a",   "b.a",      False, True,  True,  {}),
+	("**/*.a",   "u/v/b.a",  False, True,  True,  {}),
+	("**/*.a",   ".u/b.a",   False, True,  False, {}),
+	("**/*.a",   ".u/b.a",   False, True,  True,  {"period_special": False}),
+	("**/*.a",   "u/.v/b.a", False, True,  False, {}),
+	("**/*.a",   ".u",       True,  True,  False, {}),
+	("b/**",     "b",        True,  True,  False, {}),
+	("b/**",     "b/c",      False, True,  True,  {}),
+	("b/**",     "b/.c",     False, True,  False, {}),
+	("b/**",     "b/c/.d",   False, True,  True,  {}),
+	("*/b/**",   "u/b/c/d",  False, True,  True,  {}),
+	("*/b/**",   ".u/b/c",   False, False, False, {}),
+	("**/b/",    "u/b",      True,  True,  True,  {}),
+	("**/b/",    "u/b",      False, True,  False, {}),
+	
+	# Tests for character sets with hyphens and exclamation marks
+	("**/[a--]", "u/a",      False, True,  False, {}),
+	("**/[a--]", "u/-",      False, True,  False, {}),
+	("**/[--b]", "u/-",      False, True,  True,  {}),
+	("**/[--b]", "u/b",      False, True,  True,  {}),
+	("**/[--b]", "u/c",      False, True,  False, {}),
+	("**/[!]",   "u/!",      False, True,  False, {}),
+	("**/[!]",   "u/[!]",    False, True,  True,  {}),
+	
 	# Regular expression test
 	(re.compile(r"[^/\\]+[/\\](IMG-\d{0,4}\.jpeg)?$"),  "Camera/IMG-0169.jpeg",  False, True, True,  {}),
 	(re.compile(r"[^/\\]+[/\\](IMG-\d{0,4}\.jpeg)?$"),  "Camera",                True,  True, True,  {}),
@@ -141,6 +195,25 @@ def test_glob_matching(
 	matcher = filescanner.matcher_from_spec(pattern, **kwargs)
 	assert matcher.should_descend(path)               is descend
 	assert matcher.should_report(path, is_dir=is_dir) is report
+	
+	labels = path.split(sep)  # type: ty.List[ty.AnyStr]
+	assert matcher.should_descend_labels(labels)               is descend
+	assert matcher.should_report_labels(labels, is_dir=is_dir) is report
+	
+	# Passing the already joined path must not make any difference
+	assert matcher.should_descend_labels(labels, path=path)               is descend
+	assert matcher.should_report_labels(labels, is_dir=is_dir, path=path) is report
+
+
+@pytest.mark.parametrize("pattern", ["**/[a--]", "**/[a-&&b]", "**/[|~]"])
+def test_glob_full_path_no_warnings(monkeypatch, pattern: str):
+	monkeypatch.setattr(filescanner, "_GLOB_CACHE", collections.OrderedDict())
+	monkeypatch.setattr(filescanner, "_LABEL_RE_CACHE", collections.OrderedDict())
+	
+	# Sets must be escaped to not be mistaken for (future) set operations
+	with warnings.catch_warnings():
+		warnings.simplefilter("error")
+		assert filescanner.GlobMatcher(pattern)._full_re is not None
 
 
 def test_walk_fd_unsupported(monkeypatch):
@@ -159,16 +232,88 @@ def test_walk_instaclose(mocker):
 	close_spy.assert_called_once()
 
 
+def _open_fds() -> ty.Set[str]:
+	return set(os.listdir("/proc/self/fd"))
+
+
+@pytest.mark.skipif(not filescanner.HAVE_FWALK, reason="Platform does not support scanning by file descriptor")
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="Platform does not list open file descriptors")
+def test_walk_close_fd():
+	fds_before = _open_fds()  # type: ty.Set[str]
+	scanner = filescanner.walk(TEST_FILE_DIR)
+	list(scanner)
+	assert _open_fds() != fds_before  # Still open after exhausting the scanner
+	
+	scanner.close()
+	assert _open_fds() == fds_before
+	
+	# Closing more than once is fine
+	scanner.close()
+
+
+@pytest.mark.skipif(not filescanner.HAVE_FWALK, reason="Platform does not support scanning by file descriptor")
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="Platform does not list open file descriptors")
+def test_walk_close_fd_on_gc():
+	fds_before = _open_fds()  # type: ty.Set[str]
+	scanner = filescanner.walk(TEST_FILE_DIR)
+	next(scanner)
+	assert _open_fds() != fds_before
+	
+	del scanner
+	gc.collect()
+	assert _open_fds() == fds_before
+
+
 @pytest.mark.parametrize("path,pattern,kwargs,expected", [
 	(TEST_FILE_DIR + os.path.sep + "fake_dir_almost_empty" + os.path.sep, None, {}, [
 		(filescanner.FSNodeType.DIRECTORY, ".", "."),
 		(filescanner.FSNodeType.FILE, ".gitignore", ".gitignore"),
 	]),
+	(TEST_FILE_DIR + os.path.sep + "fake_dir", None, {}, [
+		(filescanner.FSNodeType.DIRECTORY, ".", "."),
+		(filescanner.FSNodeType.FILE, "fsdfgh", "fsdfgh"),
+		(filescanner.FSNodeType.FILE, "popoiopiu", "popoiopiu"),
+		(filescanner.FSNodeType.DIRECTORY, "test2", "test2"),
+		(filescanner.FSNodeType.FILE, os.path.join("test2", "fssdf"), "fssdf"),
+		(filescanner.FSNodeType.DIRECTORY, os.path.join("test2", "high"), "high"),
+		(filescanner.FSNodeType.DIRECTORY, os.path.join("test2", "high", "five"), "five"),
+		(filescanner.FSNodeType.FILE, os.path.join("test2", "high", "five", "dummy"), "dummy"),
+		(filescanner.FSNodeType.FILE, os.path.join("test2", "llllg"), "llllg"),
+		(filescanner.FSNodeType.DIRECTORY, "test3", "test3"),
+		(filescanner.FSNodeType.FILE, os.path.join("test3", "ppppoooooooooo"), "ppppoooooooooo"),
+	]),
+	(TEST_FILE_DIR + os.path.sep + "fake_dir", "**", {"recursive": False}, [
+		(filescanner.FSNodeType.DIRECTORY, ".", "."),
+		(filescanner.FSNodeType.FILE, "fsdfgh", "fsdfgh"),
+		(filescanner.FSNodeType.FILE, "popoiopiu", "popoiopiu"),
+		(filescanner.FSNodeType.DIRECTORY, "test2", "test2"),
+		(filescanner.FSNodeType.DIRECTORY, "test3", "test3"),
+	]),
 	(TEST_FILE_DIR + os.path.sep + "fake_dir", ["test2", "test3"], {}, [
 		(filescanner.FSNodeType.DIRECTORY, ".", "."),
 		(filescanner.FSNodeType.DIRECTORY, "test2", "test2"),
 		(filescanner.FSNodeType.DIRECTORY, "test3", "test3"),
 	]),
+	(TEST_FILE_DIR + os.path.sep + "fake_dir", "**/five/dummy", {}, [
+		(filescanner.FSNodeType.DIRECTORY, ".", "."),
+		(filescanner.FSNodeType.DIRECTORY, "test2", "test2"),
+		(filescanner.FSNodeType.DIRECTORY, os.path.join("test2", "high"), "high"),
+		(filescanner.FSNodeType.DIRECTORY, os.path.join("test2", "high", "five"), "five"),
+		(filescanner.FSNodeType.FILE, os.path.join("test2", "high", "five", "dummy"), "dummy"),
+	]),
+	(TEST_FILE_DIR + os.path.sep + "fake_dir", "**/five/dummy", {"intermediate_dirs": False}, [
+		(filescanner.FSNodeType.DIRECTORY, ".", "."),
+		(filescanner.FSNodeType.DIRECTORY, os.path.join("test2", "high", "five"), "five"),
+		(filescanner.FSNodeType.FILE, os.path.join("test2", "high", "five", "dummy"), "dummy"),
+	]),
+	(TEST_FILE_DIR + os.path.sep + "fake_dir", ["test2/fssdf", "test2/high/**"], {}, [
+		(filescanner.FSNodeType.DIRECTORY, ".", "."),
+		(filescanner.FSNodeType.DIRECTORY, "test2", "test2"),
+		(filescanner.FSNodeType.FILE, os.path.join("test2", "fssdf"), "fssdf"),
+		(filescanner.FSNodeType.DIRECTORY, os.path.join("test2", "high"), "high"),
+		(filescanner.FSNodeType.DIRECTORY, os.path.join("test2", "high", "five"), "five"),
+		(filescanner.FSNodeType.FILE, os.path.join("test2", "high", "five", "dummy"), "dummy"),
+	]),
 ])
 def test_walk(monkeypatch, path: str, pattern: None, kwargs: ty.Dict[str, bool], expected: ty.List[filescanner.FSNodeEntry]):
 	result = [(e.type, e.relpath, e.name) for e in filescanner.walk(path, pattern, **kwargs)]
@@ -182,5 +327,75 @@ def test_walk(monkeypatch, path: str, pattern: None, kwargs: ty.Dict[str, bool],
 		assert sorted(result, key=lambda r: r[1]) == expected
 
 
+class NoDescendMatcher(filescanner.Matcher[str]):
+	def should_descend(self, path: str) -> bool:
+		return path != "test2"
+	
+	def should_report(self, path: str, *, is_dir: bool) -> bool:
+		return True
+
+
+def test_walk_no_descend():
+	result = [e.relpath for e in filescanner.walk(TEST_FILE_DIR + os.path.sep + "fake_dir", NoDescendMatcher())]
+	assert sorted(result) == [
+		".", "fsdfgh", "popoiopiu", "test2", "test3", os.path.join("test3", "ppppoooooooooo")
+	]
+
+
+class CountingMatcher(filescanner.Matcher[str]):
+	def __init__(self):
+		self.descend_paths = []  # type: ty.List[str]
+	
+	def should_descend(self, path: str) -> bool:
+		self.descend_paths.append(path)
+		return True
+	
+	def should_report(self, path: str, *, is_dir: bool) -> bool:
+		return False
+
+
+def test_walk_descend_once():
+	matcher = CountingMatcher()
+	assert [e.relpath for e in filescanner.walk(TEST_FILE_DIR + os.path.sep + "fake_dir", matcher)] == ["."]
+	assert sorted(matcher.descend_paths) == [
+		"test2", os.path.join("test2", "high"), os.path.join("test2", "high", "five"), "test3"
+	]
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="Platform does not support symbolic links")
+@pytest.mark.parametrize("follow_symlinks,expected", [
+	(False, [
+		(filescanner.FSNodeType.DIRECTORY, ".", "."),
+		(filescanner.FSNodeType.DIRECTORY, "dir", "dir"),
+		(filescanner.FSNodeType.FILE, os.path.join("dir", "file"), "file"),
+		(filescanner.FSNodeType.DIRECTORY, "link", "link"),
+	]),
+	(True, [
+		(filescanner.FSNodeType.DIRECTORY, ".", "."),
+		(filescanner.FSNodeType.DIRECTORY, "dir", "dir"),
+		(filescanner.FSNodeType.FILE, os.path.join("dir", "file"), "file"),
+		(filescanner.FSNodeType.DIRECTORY, "link", "link"),
+		(filescanner.FSNodeType.FILE, os.path.join("link", "file"), "file"),
+	]),
+])
+def test_walk_symlinks(monkeypatch, tmp_path, follow_symlinks: bool, expected: ty.List[filescanner.FSNodeEntry]):
+	(tmp_path / "dir").mkdir()
+	(tmp_path / "dir" / "file").touch()
+	try:
+		(tmp_path / "link").symlink_to("dir", target_is_directory=True)
+	except OSError:  # pragma: no cover
+		pytest.skip("Not permitted to create symbolic links")
+	
+	result = [(e.type, e.relpath, e.name) for e in filescanner.walk(str(tmp_path), follow_symlinks=follow_symlinks)]
+	assert sorted(result, key=lambda r: r[1]) == expected
+	
+	# Check again with plain path access if the current platform supports `os.fwalk`
+	if filescanner.HAVE_FWALK:
+		monkeypatch.setattr(filescanner, "HAVE_FWALK", False)
+		
+		result = [(e.type, e.relpath, e.name) for e in filescanner.walk(str(tmp_path), follow_symlinks=follow_symlinks)]
+		assert sorted(result, key=lambda r: r[1]) == expected
+
+
 def test_supports_fd():
 	assert (filescanner.walk in filescanner.supports_fd) is filescanner.HAVE_FWALK